@@ -3,27 +3,162 @@
 Script to geocode Swiss municipalities for the heavy metals monitoring data.
 This script extracts unique municipalities from data.csv and geocodes them using
 the OpenStreetMap Nominatim API, storing results in municipalities_geocoded.csv.
+
+If swiss_municipality_centroids.csv is present (columns name, lat, lon, e.g. the
+municipality centroids exported from swisstopo's swissBOUNDARIES3D), names are
+resolved from it locally first and only the unmatched ones are sent to Nominatim.
 """
 
+import asyncio
+import httpx
+import orjson
 import pandas as pd
-import requests
-import time
 import csv
+import difflib
+import json
+import os
+import tempfile
+import time
+import unicodedata
 from typing import Tuple, Optional
 
-def geocode_municipality(municipality: str, country: str = "Switzerland") -> Tuple[Optional[float], Optional[float]]:
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = "Heavy-Metals-Monitoring-App/1.0"
+
+# Nominatim's usage policy allows at most one request per second. Each slot is
+# held for at least a second, so a single slot keeps the total rate within it.
+MAX_CONCURRENT_REQUESTS = 1
+
+# Transient failures are retried with exponential backoff (1s, 2s, 4s)
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+GEO_CACHE_FILE = ".geocode_cache.json"
+RESULT_FIELDNAMES = ['Municipality', 'Latitude', 'Longitude']
+
+CENTROIDS_FILE = "swiss_municipality_centroids.csv"
+FUZZY_MATCH_CUTOFF = 0.92
+
+def _normalize_name(municipality: str) -> str:
+    """Normalize a municipality name for comparison, ignoring case and spacing."""
+    return unicodedata.normalize('NFKC', municipality.strip().lower())
+
+def _cache_key(municipality: str, country: str = "Switzerland") -> str:
+    """Build the cache key for a municipality, insensitive to case and spacing."""
+    return _normalize_name(municipality) + '|' + country.lower()
+
+def load_geocode_cache(cache_file: str) -> dict:
+    """
+    Load previously resolved coordinates from the on-disk cache.
+    
+    Args:
+        cache_file: Path to the JSON cache file
+    
+    Returns:
+        Dictionary mapping cache keys to [latitude, longitude] pairs
+    """
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_geocode_cache(cache_file: str):
+    """Atomically write the in-memory cache to disk."""
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(GEO_CACHE, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_file)
+
+def seed_geocode_cache(results_file: str):
+    """
+    Add coordinates from a previous (possibly interrupted) run to the cache.
+    
+    Args:
+        results_file: Path to a CSV written by save_results
+    """
+    try:
+        previous = pd.read_csv(results_file).dropna(subset=['Latitude', 'Longitude'])
+    except FileNotFoundError:
+        return
+    
+    for row in previous.itertuples(index=False):
+        GEO_CACHE.setdefault(_cache_key(row.Municipality), [row.Latitude, row.Longitude])
+
+def load_local_centroids(centroids_file: str) -> dict:
+    """
+    Load municipality centroids from a local export of the official boundaries.
+    
+    Args:
+        centroids_file: Path to a CSV file with name, lat and lon columns
+    
+    Returns:
+        Dictionary mapping normalized names to [latitude, longitude] pairs,
+        empty if the file does not exist
+    """
+    try:
+        centroids = pd.read_csv(centroids_file, usecols=['name', 'lat', 'lon'])
+    except FileNotFoundError:
+        return {}
+    
+    return {_normalize_name(name): [lat, lon] for name, lat, lon in centroids.itertuples(index=False)}
+
+def seed_from_local_centroids(municipalities: list, centroids_file: str) -> int:
+    """
+    Resolve municipalities from local centroids into the cache, so that only
+    the unmatched ones are sent to Nominatim.
+    
+    Args:
+        municipalities: List of municipality names
+        centroids_file: Path to the local centroids CSV file
+    
+    Returns:
+        Number of municipalities resolved locally
+    """
+    centroids = load_local_centroids(centroids_file)
+    if not centroids:
+        return 0
+    
+    resolved = 0
+    for municipality in municipalities:
+        key = _cache_key(municipality)
+        if key in GEO_CACHE:
+            continue
+        
+        name = _normalize_name(municipality)
+        coordinates = centroids.get(name)
+        if coordinates is None:
+            # Tolerate small spelling differences, e.g. missing accents
+            matches = difflib.get_close_matches(name, centroids.keys(), n=1, cutoff=FUZZY_MATCH_CUTOFF)
+            coordinates = centroids[matches[0]] if matches else None
+        
+        if coordinates is not None:
+            GEO_CACHE[key] = coordinates
+            resolved += 1
+    
+    return resolved
+
+GEO_CACHE = load_geocode_cache(GEO_CACHE_FILE)
+
+async def geocode_municipality(client: httpx.AsyncClient, municipality: str, country: str = "Switzerland") -> Tuple[Optional[float], Optional[float]]:
     """
     Geocode a municipality using the Nominatim API.
     
     Args:
+        client: Shared HTTP client used for all Nominatim requests
         municipality: The municipality name to geocode
         country: The country name (default: "Switzerland")
     
     Returns:
         Tuple of (latitude, longitude) or (None, None) if not found
     """
-    # Nominatim API endpoint
-    url = "https://nominatim.openstreetmap.org/search"
+    key = _cache_key(municipality, country)
+    if key in GEO_CACHE:
+        lat, lon = GEO_CACHE[key]
+        print(f"✓ Cached coordinates for {municipality}: ({lat:.4f}, {lon:.4f})")
+        return lat, lon
     
     # Parameters for the request
     params = {
@@ -33,34 +168,72 @@ def geocode_municipality(municipality: str, country: str = "Switzerland") -> Tup
         'addressdetails': 1
     }
     
-    # Add user agent as required by Nominatim
-    headers = {
-        'User-Agent': 'Heavy-Metals-Monitoring-App/1.0'
-    }
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await client.get(NOMINATIM_URL, params=params)
+            if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+            break
+        except httpx.TransportError as e:
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            print(f"✗ Error geocoding {municipality}: {e}")
+            return None, None
+        except httpx.HTTPError as e:
+            print(f"✗ Error geocoding {municipality}: {e}")
+            return None, None
+        except ValueError as e:
+            print(f"✗ Error parsing response for {municipality}: {e}")
+            return None, None
     
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
         if data and len(data) > 0:
             lat = float(data[0]['lat'])
             lon = float(data[0]['lon'])
             print(f"✓ Found coordinates for {municipality}: ({lat:.4f}, {lon:.4f})")
+            GEO_CACHE[key] = [lat, lon]
             return lat, lon
         else:
             print(f"✗ No coordinates found for {municipality}")
             return None, None
-            
-    except requests.exceptions.RequestException as e:
-        print(f"✗ Error geocoding {municipality}: {e}")
-        return None, None
     except (KeyError, ValueError, IndexError) as e:
         print(f"✗ Error parsing response for {municipality}: {e}")
         return None, None
 
-def extract_unique_municipalities(csv_file: str) -> list:
+async def geocode_with_limit(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, municipality: str) -> dict:
+    """
+    Geocode a municipality while holding a slot of the shared semaphore.
+    
+    Args:
+        client: Shared HTTP client used for all Nominatim requests
+        semaphore: Semaphore bounding the number of requests in flight
+        municipality: The municipality name to geocode
+    
+    Returns:
+        Result row with Municipality, Latitude and Longitude keys
+    """
+    if _cache_key(municipality) in GEO_CACHE:
+        # Cached lookups never reach the API, so they skip the rate limit
+        lat, lon = await geocode_municipality(client, municipality)
+    else:
+        async with semaphore:
+            started = time.monotonic()
+            lat, lon = await geocode_municipality(client, municipality)
+            # Be respectful to the API - keep the slot busy for a second,
+            # counting the time already spent on the request itself
+            await asyncio.sleep(max(0.0, 1.0 - (time.monotonic() - started)))
+    
+    return {
+        'Municipality': municipality,
+        'Latitude': lat,
+        'Longitude': lon
+    }
+
+def extract_unique_municipalities(csv_file: str) -> Tuple[list, dict]:
     """
     Extract unique municipalities from the data CSV file.
     
@@ -68,52 +241,108 @@ def extract_unique_municipalities(csv_file: str) -> list:
         csv_file: Path to the data CSV file
     
     Returns:
-        List of unique municipality names
+        Tuple of (sorted canonical municipality names, mapping of each name
+        as spelled in the data to its canonical name)
     """
-    df = pd.read_csv(csv_file)
-    municipalities = df['Municipality'].unique().tolist()
+    # Only the municipality column is needed; as a categorical its unique
+    # values are simply the categories
+    df = pd.read_csv(csv_file, usecols=['Municipality'], dtype={'Municipality': 'category'})
+    display_names = df['Municipality'].value_counts().index.tolist()
+    
+    # Spelling variants ("Zürich", " zürich ") share the most frequent one as
+    # their canonical name, so each place is only geocoded once
+    canonical_names = {}
+    display_to_canonical = {}
+    for name in display_names:
+        display_to_canonical[name] = canonical_names.setdefault(
+            _normalize_name(name), unicodedata.normalize('NFKC', name).strip()
+        )
+    
+    municipalities = sorted(canonical_names.values())
     print(f"Found {len(municipalities)} unique municipalities")
-    return sorted(municipalities)
+    if len(municipalities) < len(display_names):
+        print(f"Merged {len(display_names) - len(municipalities)} spelling variants")
+    return municipalities, dict(sorted(display_to_canonical.items()))
 
-def geocode_all_municipalities(municipalities: list, output_file: str):
+async def geocode_all_municipalities_async(municipalities: list, output_file: str) -> list:
     """
-    Geocode all municipalities and save results to CSV.
+    Geocode all municipalities concurrently, streaming each result to CSV.
     
     Args:
         municipalities: List of municipality names
         output_file: Path to output CSV file
+    
+    Returns:
+        List of result rows, in the order of the input municipalities
     """
     results = []
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    # A single keep-alive client, so requests reuse (and over HTTP/2 multiplex
+    # on) one connection instead of paying a TLS handshake each
+    limits = httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS, max_keepalive_connections=MAX_CONCURRENT_REQUESTS)
+    
+    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=RESULT_FIELDNAMES)
+        writer.writeheader()
+        
+        # Add user agent as required by Nominatim
+        async with httpx.AsyncClient(http2=True, headers={'User-Agent': USER_AGENT}, timeout=10.0, limits=limits) as client:
+            tasks = [geocode_with_limit(client, semaphore, m) for m in municipalities]
+            
+            for i, task in enumerate(asyncio.as_completed(tasks), 1):
+                result = await task
+                results.append(result)
+                
+                # Write each result as soon as it arrives so an interruption loses nothing
+                writer.writerow(result)
+                csvfile.flush()
+                print(f"[{i}/{len(municipalities)}] Geocoded {result['Municipality']}")
+                
+                if len(results) % 10 == 0:
+                    save_geocode_cache(GEO_CACHE_FILE)
+    
+    # Requests complete out of order; restore the input order for the final file
+    order = {m: i for i, m in enumerate(municipalities)}
+    return sorted(results, key=lambda r: order[r['Municipality']])
+
+def geocode_all_municipalities(municipalities: list, output_file: str, display_names: Optional[dict] = None):
+    """
+    Geocode all municipalities and save results to CSV.
+    
+    Args:
+        municipalities: List of municipality names
+        output_file: Path to output CSV file
+        display_names: Optional mapping of names as spelled in the data to the
+            canonical names in municipalities; the saved file then has one
+            row per spelling so it still joins on the data
+    """
+    # Resume from the coordinates a previous run already wrote out
+    seed_geocode_cache(output_file)
+    
+    resolved = seed_from_local_centroids(municipalities, CENTROIDS_FILE)
+    if resolved:
+        print(f"Resolved {resolved} municipalities from {CENTROIDS_FILE}")
     
     print(f"Starting geocoding of {len(municipalities)} municipalities...")
     print("This may take a few minutes due to API rate limiting.")
     
-    for i, municipality in enumerate(municipalities, 1):
-        print(f"[{i}/{len(municipalities)}] Geocoding {municipality}...")
-        
-        lat, lon = geocode_municipality(municipality)
-        
-        results.append({
-            'Municipality': municipality,
-            'Latitude': lat,
-            'Longitude': lon
-        })
-        
-        # Be respectful to the API - add a small delay
-        time.sleep(1)
-        
-        # Save progress every 10 municipalities in case of interruption
-        if i % 10 == 0:
-            save_results(results, output_file)
-            print(f"Progress saved after {i} municipalities")
-    
-    # Final save
-    save_results(results, output_file)
+    results = asyncio.run(geocode_all_municipalities_async(municipalities, output_file))
     
     # Summary
     successful = sum(1 for r in results if r['Latitude'] is not None)
     failed = len(results) - successful
     
+    if display_names:
+        by_name = {r['Municipality']: r for r in results}
+        results = [
+            {**by_name[canonical], 'Municipality': display}
+            for display, canonical in display_names.items()
+        ]
+    
+    # Rewrite once in input order; the streamed file is in completion order
+    save_results(results, output_file)
+    save_geocode_cache(GEO_CACHE_FILE)
+    
     print(f"\nGeocoding completed!")
     print(f"✓ Successfully geocoded: {successful} municipalities")
     print(f"✗ Failed to geocode: {failed} municipalities")
@@ -122,8 +351,7 @@ def geocode_all_municipalities(municipalities: list, output_file: str):
 def save_results(results: list, output_file: str):
     """Save geocoding results to CSV file."""
     with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['Municipality', 'Latitude', 'Longitude']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.DictWriter(csvfile, fieldnames=RESULT_FIELDNAMES)
         writer.writeheader()
         writer.writerows(results)
 
@@ -137,7 +365,7 @@ def main():
     
     # Check if input file exists
     try:
-        municipalities = extract_unique_municipalities(input_file)
+        municipalities, display_names = extract_unique_municipalities(input_file)
     except FileNotFoundError:
         print(f"Error: Could not find {input_file}")
         return
@@ -146,7 +374,7 @@ def main():
         return
     
     # Start geocoding
-    geocode_all_municipalities(municipalities, output_file)
+    geocode_all_municipalities(municipalities, output_file, display_names)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,13 +2,51 @@
 Heavy Metal Detail Page - Deep dive into one heavy metal across all municipalities
 """
 import streamlit as st
-import pandas as pd
+import numpy as np
+from utils.data_utils import get_app_data, filter_data
 from utils.chart_utils import (
     create_municipality_ranking_chart,
     create_time_evolution_chart,
     create_land_use_box_plot
 )
-from utils.filter_utils import display_page_header, display_section_header, check_data_availability
+from utils.filter_utils import (
+    display_sidebar_filters,
+    display_data_summary,
+    display_footer,
+    display_page_header,
+    display_section_header,
+    check_data_availability
+)
+
+
+@st.cache_data
+def calculate_metal_trends(metal_data):
+    """Compute the municipality ranking and yearly trend tables for one heavy metal"""
+    concentration = 'Heavy metal concentration (mg/kg DM)'
+    muni_ranking = metal_data.groupby('Municipality', observed=True)[concentration].agg([
+        'mean', 'count', 'min', 'max'
+    ]).reset_index()
+    muni_ranking = muni_ranking.sort_values('mean', ascending=False)
+    
+    # Get top 8 municipalities for clarity
+    top_munis = muni_ranking['Municipality'].head(8).tolist()
+    time_data = metal_data[metal_data['Municipality'].isin(top_munis)]
+    
+    yearly_trends = time_data.groupby(['Year', 'Municipality'], observed=True)[concentration].mean().reset_index()
+    
+    # Overall average line
+    overall_yearly = metal_data.groupby('Year', observed=True)[concentration].mean().reset_index()
+    
+    return muni_ranking.head(15), yearly_trends, overall_yearly
+
+
+def calculate_landuse_stats(metal_data):
+    """Compute the per land use statistics table for one heavy metal"""
+    landuse_stats = metal_data.groupby('Land use', observed=True)['Heavy metal concentration (mg/kg DM)'].agg([
+        'count', 'mean', 'median', 'min', 'max', 'std'
+    ]).round(2)
+    landuse_stats.columns = ['Count', 'Mean', 'Median', 'Min', 'Max', 'Std Dev']
+    return landuse_stats
 
 
 def show_heavy_metal_detail_page(filtered_df, filters):
@@ -32,6 +70,9 @@ def show_heavy_metal_detail_page(filtered_df, filters):
     if len(metal_data) == 0:
         st.warning(f"No data available for {selected_heavy_metal_detail}. Please select a different heavy metal.")
         return
+    
+    # Cached on the content of the slice, so reruns with unchanged filters skip the groupbys
+    muni_ranking, yearly_trends, overall_yearly = calculate_metal_trends(metal_data)
         
     col1, col2 = st.columns(2)
     with col1:
@@ -41,11 +82,6 @@ def show_heavy_metal_detail_page(filtered_df, filters):
             "Which municipalities show the highest concentrations of this heavy metal?"
         )
         
-        muni_ranking = metal_data.groupby('Municipality')['Heavy metal concentration (mg/kg DM)'].agg([
-            'mean', 'count', 'min', 'max', 'std'
-        ]).reset_index()
-        muni_ranking = muni_ranking.sort_values('mean', ascending=False).head(15)
-        
         fig = create_municipality_ranking_chart(muni_ranking, selected_heavy_metal_detail)
         st.plotly_chart(fig, width="stretch")
     
@@ -57,15 +93,6 @@ def show_heavy_metal_detail_page(filtered_df, filters):
             "How has this heavy metal changed over time across different municipalities?"
         )
         
-        # Get top 8 municipalities for clarity
-        top_munis = muni_ranking.head(8)['Municipality'].tolist()
-        time_data = metal_data[metal_data['Municipality'].isin(top_munis)]
-        
-        yearly_trends = time_data.groupby(['Year', 'Municipality'])['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
-        
-        # Add overall average line
-        overall_yearly = metal_data.groupby('Year')['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
-        
         fig = create_time_evolution_chart(yearly_trends, overall_yearly, selected_heavy_metal_detail)
         st.plotly_chart(fig, width="stretch")
         
@@ -86,24 +113,48 @@ def show_heavy_metal_detail_page(filtered_df, filters):
     
     with col1:
         st.subheader("📊 Land Use Statistics")
-        landuse_stats = metal_data.groupby('Land use')['Heavy metal concentration (mg/kg DM)'].agg([
-            'count', 'mean', 'median', 'min', 'max', 'std'
-        ]).round(2)
-        landuse_stats.columns = ['Count', 'Mean', 'Median', 'Min', 'Max', 'Std Dev']
+        landuse_stats = calculate_landuse_stats(metal_data)
         st.dataframe(landuse_stats, width="stretch")
     
     with col2:
         st.subheader("🔢 Overall Statistics")
-        overall_stats = metal_data['Heavy metal concentration (mg/kg DM)'].describe()
+        # Only four statistics are shown, so skip describe() and its quantile sort
+        concentrations = metal_data['Heavy metal concentration (mg/kg DM)'].to_numpy()
+        overall_stats = {
+            'mean': concentrations.mean(),
+            'median': np.median(concentrations),
+            'std': concentrations.std(ddof=1) if len(concentrations) > 1 else np.nan,
+            'max': concentrations.max(),
+        }
         
         # Display as metrics
         st.metric("Total Samples", f"{len(metal_data):,}")
         st.metric("Mean Concentration", f"{overall_stats['mean']:.2f} mg/kg DM")
-        st.metric("Median Concentration", f"{overall_stats['50%']:.2f} mg/kg DM")
+        st.metric("Median Concentration", f"{overall_stats['median']:.2f} mg/kg DM")
         st.metric("Standard Deviation", f"{overall_stats['std']:.2f}")
         st.metric("Max Concentration", f"{overall_stats['max']:.2f} mg/kg DM")
         
         # Show municipality with max concentration
-        max_idx = metal_data['Heavy metal concentration (mg/kg DM)'].idxmax()
-        max_municipality = metal_data.loc[max_idx, 'Municipality']
-        st.metric("Highest in Municipality", max_municipality)
\ No newline at end of file
+        max_pos = int(np.argmax(concentrations))
+        max_municipality = metal_data['Municipality'].iat[max_pos]
+        st.metric("Highest in Municipality", max_municipality)
+
+
+if __name__ == "__main__":
+    df, municipalities, heavy_metals, land_uses, year_min, year_max = get_app_data()
+    
+    # Create filters specific to heavy metal page
+    filters = display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, year_max, "heavy_metal")
+    
+    # Filter data
+    filtered_df = filter_data(df, filters['municipalities'], filters['heavy_metals'], 
+                             filters['land_uses'], filters['year_range'])
+    
+    # Display data summary
+    display_data_summary(filtered_df)
+    
+    # Show heavy metal detail page content
+    show_heavy_metal_detail_page(filtered_df, filters)
+    
+    # Display footer
+    display_footer(year_min, year_max, len(municipalities))
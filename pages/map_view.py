@@ -4,71 +4,114 @@ Map View Page - Interactive map showing heavy metal concentrations by municipali
 import streamlit as st
 import pandas as pd
 import folium
-from streamlit_folium import st_folium
 import numpy as np
-from utils.data_utils import load_data, get_unique_values
-from utils.filter_utils import display_page_header, display_section_header, check_data_availability
-
-
-@st.cache_data
-def load_geocoded_data():
-    """Load the geocoded municipalities data"""
-    try:
-        return pd.read_csv('municipalities_geocoded.csv')
-    except FileNotFoundError:
-        st.error("⚠️ Geocoded municipalities file not found. Please run the geocoding script first.")
-        return None
+from utils.data_utils import get_app_data, get_app_data_with_coords, filter_data
+from utils.filter_utils import (
+    display_sidebar_filters,
+    display_footer,
+    display_page_header,
+    display_section_header,
+    check_data_availability
+)
 
 
 def calculate_concentration_stats(filtered_df, selected_metal):
-    """Calculate concentration statistics for color coding"""
+    """
+    Calculate the concentration quantiles used for color coding: minimum,
+    25th, 50th and 75th percentiles and maximum, in a single pass
+    """
     if filtered_df.empty:
-        return None, None, None
+        return None
     
-    concentrations = filtered_df['Heavy metal concentration (mg/kg DM)']
-    return concentrations.min(), concentrations.max(), concentrations.quantile([0.25, 0.5, 0.75])
+    return np.quantile(filtered_df['Heavy metal concentration (mg/kg DM)'].to_numpy(), [0, 0.25, 0.5, 0.75, 1])
 
 
-def get_color_for_concentration(concentration, min_val, max_val, quantiles):
-    """Get color based on concentration level using quantile-based coloring"""
-    if pd.isna(concentration):
-        return 'gray'
-    
-    # Normalize concentration to 0-1 range
+# Color scale from green (low) to red (high), one color per quartile
+CONCENTRATION_COLORS = np.array([
+    '#2ECC71',  # Green
+    '#F39C12',  # Orange
+    '#E67E22',  # Dark Orange
+    '#E74C3C',  # Red
+])
+
+
+def get_colors_for_concentrations(concentrations, quantiles):
+    """Get the color of each concentration level using quantile-based coloring"""
+    values = concentrations.to_numpy()
+    # Quartile of each value, upper bounds inclusive; tied quantiles simply leave a color unused
+    quartiles = np.searchsorted(quantiles[1:4], values, side='left')
+    return np.where(np.isnan(values), 'gray', CONCENTRATION_COLORS[np.minimum(quartiles, 3)])
+
+
+def get_marker_sizes(concentrations, min_val, max_val):
+    """Get marker radii relative to the other concentrations, between 8 and 23"""
     if max_val > min_val:
-        normalized = (concentration - min_val) / (max_val - min_val)
-    else:
-        normalized = 0.5
-    
-    # Color scale from green (low) to red (high)
-    if normalized <= 0.25:
-        return '#2ECC71'  # Green
-    elif normalized <= 0.5:
-        return '#F39C12'  # Orange
-    elif normalized <= 0.75:
-        return '#E67E22'  # Dark Orange
-    else:
-        return '#E74C3C'  # Red
+        return 8 + (concentrations - min_val) / (max_val - min_val) * 15
+    return pd.Series(15, index=concentrations.index)
+
+
+LEGEND_TEMPLATE = """
+    <div style="position: fixed; 
+                bottom: 50px; left: 50px; width: 300px; height: 180px; 
+                background-color: rgba(255,255,255,0.5); border:0px solid grey; z-index:9999; 
+                display: flex; flex-direction: column; justify-content: center;
+                backdrop-filter: blur(5px);
+                color: black;
+                font-size:14px; padding: 10px">
+    <h5 style="margin-top:0;">{metal} Concentration</h5>
+    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#2ECC71"></i> Low (≤ 25th percentile)</p>
+    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#F39C12"></i> Medium-Low (25-50th)</p>
+    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#E67E22"></i> Medium-High (50-75th)</p>
+    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#E74C3C"></i> High (> 75th percentile)</p>
+    </div>
+    """
+
+
+def build_tooltips(muni_data, selected_metal):
+    """Build the tooltip HTML of every marker with column-wise string concatenation"""
+    concentrations = muni_data['Heavy metal concentration (mg/kg DM)'].map('{:.2f}'.format)
+    return (
+        '<div style="width: 200px;">'
+        '<h5>' + muni_data['Municipality'].astype(str) + '</h5>'
+        f'<p><strong>{selected_metal.title()}:</strong> ' + concentrations + ' mg/kg DM<br/>'
+        '<strong>Year:</strong> ' + muni_data['Year'].astype(str) + '<br/>'
+        '<strong>Land Use:</strong> ' + muni_data['Land use'].astype(str) + '</p>'
+        '</div>'
+    )
 
 
+@st.cache_data(show_spinner=False)
 def create_map(filtered_df_coords, selected_metal):
-    """Create a folium map with heavy metal concentration data"""
+    """
+    Create a folium map with heavy metal concentration data, rendered to HTML.
+    Cached on the filtered data and metal, so reruns that do not change the
+    filters reuse the page instead of rebuilding and serializing the markers.
+    """
     # Filter data for selected metal and year
     
     if filtered_df_coords.empty:
         return None, f"No data available for {selected_metal}"
     
     # Calculate average concentration per municipality for the selected year/metal
-    most_recent_year_idx = filtered_df_coords.groupby(['Municipality', 'Latitude', 'Longitude', 'Land use'])['Year'].idxmax()
-    map_data = filtered_df_coords.loc[most_recent_year_idx].copy()
+    # Keep the most recent sample of each (municipality, land use); the stable
+    # sort keeps the first of ties, and land uses sorted for the join below
+    map_data = filtered_df_coords.sort_values(
+        ['Year', 'Land use'], ascending=[False, True], kind='stable'
+    ).drop_duplicates(['Municipality', 'Latitude', 'Longitude', 'Land use'])
 
-    muni_data = map_data.groupby(['Municipality', 'Latitude', 'Longitude', 'Year']).agg({
+    # Land uses are already unique within each group after drop_duplicates, so
+    # they are joined as they come instead of through a per-group unique()
+    muni_data = map_data.groupby(['Municipality', 'Latitude', 'Longitude', 'Year'], observed=True).agg({
         'Heavy metal concentration (mg/kg DM)': 'mean',
-        'Land use': lambda x: ', '.join(x.unique())
+        'Land use': ', '.join
     }).reset_index()
     
     # Calculate color scaling
-    min_val, max_val, quantiles = calculate_concentration_stats(map_data, selected_metal)
+    # Quantiles of the plotted values, so the legend's percentiles hold for the markers
+    quantiles = calculate_concentration_stats(muni_data, selected_metal)
+    concentrations = muni_data['Heavy metal concentration (mg/kg DM)']
+    muni_data['color'] = get_colors_for_concentrations(concentrations, quantiles)
+    muni_data['radius'] = get_marker_sizes(concentrations, quantiles[0], quantiles[-1])
     
     # Create the base map centered on Switzerland
     center_lat = 46.8182
@@ -76,65 +119,42 @@ def create_map(filtered_df_coords, selected_metal):
     m = folium.Map(
         location=[center_lat, center_lon],
         zoom_start=8,
-        tiles='OpenStreetMap'
+        tiles='OpenStreetMap',
+        # Draw the circle markers on a single canvas instead of one SVG element each
+        prefer_canvas=True
     )
     
     # Add markers for each municipality
-    for _, row in muni_data.iterrows():
-        concentration = row['Heavy metal concentration (mg/kg DM)']
-        color = get_color_for_concentration(concentration, min_val, max_val, quantiles)
-        
-        # Create popup content
-        tooltip_content = f"""
-        <div style="width: 200px;">
-            <h5>{row['Municipality']}</h5>
-            <p>
-              <strong>{selected_metal.title()}:</strong> {concentration:.2f} mg/kg DM<br/>
-              <strong>Year:</strong> {row['Year']}<br/>
-              <strong>Land Use:</strong> {row['Land use']}
-            </p>
-        </div>
-        """
-        
-        # Determine marker size based on concentration (relative to other values)
-        if max_val > min_val:
-            size_factor = (concentration - min_val) / (max_val - min_val)
-            marker_size = 8 + (size_factor * 15)  # Size between 8 and 23
-        else:
-            marker_size = 15
-        
+    tooltips = build_tooltips(muni_data, selected_metal)
+    for lat, lon, radius, color, tooltip in zip(
+        muni_data['Latitude'], muni_data['Longitude'], muni_data['radius'], muni_data['color'], tooltips
+    ):
         folium.CircleMarker(
-            location=[row['Latitude'], row['Longitude']],
-            radius=marker_size,
+            location=[lat, lon],
+            radius=radius,
             color='white',
             weight=2,
             fillColor=color,
             fillOpacity=0.7,
-            tooltip=f"{tooltip_content}"
+            tooltip=tooltip
         ).add_to(m)
     
     # Add a legend
-    legend_html = f"""
-    <div style="position: fixed; 
-                bottom: 50px; left: 50px; width: 300px; height: 180px; 
-                background-color: rgba(255,255,255,0.5); border:0px solid grey; z-index:9999; 
-                display: flex; flex-direction: column; justify-content: center;
-                backdrop-filter: blur(5px);
-                color: black;
-                font-size:14px; padding: 10px">
-    <h5 style="margin-top:0;">{selected_metal.title()} Concentration</h5>
-    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#2ECC71"></i> Low (≤ 25th percentile)</p>
-    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#F39C12"></i> Medium-Low (25-50th)</p>
-    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#E67E22"></i> Medium-High (50-75th)</p>
-    <p style="margin: 5px 0;"><i class="fa fa-circle" style="color:#E74C3C"></i> High (> 75th percentile)</p>
-    </div>
-    """
+    legend_html = LEGEND_TEMPLATE.format(metal=selected_metal.title())
     m.get_root().html.add_child(folium.Element(legend_html))
     
-    return m, f"Showing {len(muni_data)} municipalities"
+    return m.get_root().render(), f"Showing {len(muni_data)} municipalities"
+
 
+def calculate_extreme_municipalities(filtered_df_with_coords, n=5):
+    """Get the (municipality, average concentration) pairs with the n highest and n lowest averages"""
+    averages = filtered_df_with_coords.groupby('Municipality', observed=True)['Heavy metal concentration (mg/kg DM)'].mean().round(2)
+    top = averages.nlargest(n, keep='first')
+    bottom = averages.nsmallest(n, keep='first')
+    return list(zip(top.index, top)), list(zip(bottom.index, bottom))
 
-def show_map_page(filtered_df, filters):
+
+def show_map_page(filtered_df_with_coords, filters):
     """Display the map view page"""
     display_page_header(
         "🗺️ Geographic Distribution", 
@@ -143,97 +163,81 @@ def show_map_page(filtered_df, filters):
 
     selected_metal = filters['heavy_metals'][0] if filters['heavy_metals'] else 'nickel'
     
-    # Load data
-    data_df = load_data()
-    geocoded_df = load_geocoded_data()
-    
-    if data_df is None or geocoded_df is None:
+    if filtered_df_with_coords is None:
+        st.error("⚠️ Geocoded municipalities file not found. Please run the geocoding script first.")
         return
         
-    if not check_data_availability(filtered_df):
+    if not check_data_availability(filtered_df_with_coords):
         st.warning(f"No data available for {selected_metal} in the selected filters.")
         return
     
-    # Merge with geocoded data
-    filtered_df_with_coords = filtered_df.merge(
-        geocoded_df, 
-        on='Municipality', 
-        how='inner'
-    )
-    
-    if filtered_df_with_coords.empty:
-        st.error("Unable to match municipalities with geographic coordinates.")
-        return
-    
     # Display summary statistics
+    stats = filtered_df_with_coords['Heavy metal concentration (mg/kg DM)'].agg(['mean', 'max', 'min'])
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.metric(
             "Municipalities", 
-            len(filtered_df_with_coords['Municipality'].unique())
+            filtered_df_with_coords['Municipality'].nunique()
         )
     
     with col2:
-        avg_concentration = filtered_df_with_coords['Heavy metal concentration (mg/kg DM)'].mean()
         st.metric(
             "Average Concentration", 
-            f"{avg_concentration:.2f} mg/kg DM"
+            f"{stats['mean']:.2f} mg/kg DM"
         )
     
     with col3:
-        max_concentration = filtered_df_with_coords['Heavy metal concentration (mg/kg DM)'].max()
         st.metric(
             "Maximum Concentration", 
-            f"{max_concentration:.2f} mg/kg DM"
+            f"{stats['max']:.2f} mg/kg DM"
         )
     
     with col4:
-        min_concentration = filtered_df_with_coords['Heavy metal concentration (mg/kg DM)'].min()
         st.metric(
             "Minimum Concentration", 
-            f"{min_concentration:.2f} mg/kg DM"
+            f"{stats['min']:.2f} mg/kg DM"
         )
     
     # Create and display the map
     display_section_header(
         f"🎯 {selected_metal.title()} Distribution",
-        "Circle size and color represent concentration levels. Click markers for details."
+        "Circle size and color represent concentration levels. Hover markers for details."
     )
     
-    map_obj, status_message = create_map(filtered_df_with_coords, selected_metal)
+    # Reruns from widgets that do not affect the map reuse this session's map
+    # without even hashing the data for the create_map cache
+    map_key = (
+        tuple(filters['heavy_metals']), tuple(filters['land_uses']), tuple(filters['year_range']), selected_metal
+    )
+    if st.session_state.get('_map_key') != map_key:
+        st.session_state['_map'] = create_map(filtered_df_with_coords, selected_metal)
+        st.session_state['_map_key'] = map_key
+    map_html, status_message = st.session_state['_map']
     
-    if map_obj is not None:
+    if map_html is not None:
         st.info(status_message)
         
-        # Display the map
-        map_data = st_folium(
-            map_obj, 
-            width='100%', 
-            height=700,
-            returned_objects=["last_object_clicked"]
+        # Display the map as a static iframe; nothing is sent back on interaction
+        st.iframe(map_html, height=700)
+        
+        # Show details for a selected municipality
+        inspected_muni = st.selectbox(
+            "Inspect municipality",
+            sorted(filtered_df_with_coords['Municipality'].unique()),
+            index=None,
+            placeholder="Choose a municipality to see its samples"
         )
         
-        # Show details for clicked municipality
-        if map_data['last_object_clicked']:
-            clicked_coords = map_data['last_object_clicked']['lat'], map_data['last_object_clicked']['lng']
-            
-            # Find the municipality that was clicked
-            clicked_muni = None
-            for _, row in filtered_df_with_coords.iterrows():
-                if abs(row['Latitude'] - clicked_coords[0]) < 0.01 and abs(row['Longitude'] - clicked_coords[1]) < 0.01:
-                    clicked_muni = row['Municipality']
-                    break
+        if inspected_muni:
+            st.subheader(f"📍 Details for {inspected_muni}")
+            muni_data = filtered_df_with_coords[filtered_df_with_coords['Municipality'] == inspected_muni]
             
-            if clicked_muni:
-                st.subheader(f"📍 Details for {clicked_muni}")
-                muni_data = filtered_df_with_coords[filtered_df_with_coords['Municipality'] == clicked_muni]
-                
-                # Show detailed data for this municipality
-                st.dataframe(
-                    muni_data[['Sampling Period', 'Land use', 'Heavy metal concentration (mg/kg DM)', 'Sampling date']],
-                    hide_index=True
-                )
+            # Show detailed data for this municipality
+            st.dataframe(
+                muni_data[['Sampling Period', 'Land use', 'Heavy metal concentration (mg/kg DM)', 'Sampling date']],
+                hide_index=True
+            )
     else:
         st.warning(status_message)
     
@@ -243,27 +247,35 @@ def show_map_page(filtered_df, filters):
         "Municipalities with highest and lowest average concentrations"
     )
     
-    # Calculate some basic geographic statistics
-    muni_stats = filtered_df_with_coords.groupby('Municipality').agg({
-        'Heavy metal concentration (mg/kg DM)': ['mean', 'count']
-    }).round(2)
-    muni_stats.columns = ['Average Concentration', 'Sample Count']
-    muni_stats = muni_stats.reset_index()
+    top_municipalities, bottom_municipalities = calculate_extreme_municipalities(filtered_df_with_coords)
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("🔝 Highest Concentrations")
-        top_municipalities = muni_stats.nlargest(5, 'Average Concentration')
-        for _, row in top_municipalities.iterrows():
-            st.write(f"**{row['Municipality']}**: {row['Average Concentration']:.2f} mg/kg DM")
+        for municipality, average in top_municipalities:
+            st.write(f"**{municipality}**: {average:.2f} mg/kg DM")
     
     with col2:
         st.subheader("🔻 Lowest Concentrations")
-        bottom_municipalities = muni_stats.nsmallest(5, 'Average Concentration')
-        for _, row in bottom_municipalities.iterrows():
-            st.write(f"**{row['Municipality']}**: {row['Average Concentration']:.2f} mg/kg DM")
+        for municipality, average in bottom_municipalities:
+            st.write(f"**{municipality}**: {average:.2f} mg/kg DM")
 
 
 if __name__ == "__main__":
-    show_map_page()
\ No newline at end of file
+    df, municipalities, heavy_metals, land_uses, year_min, year_max = get_app_data()
+    
+    filters = display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, year_max, "map")
+    
+    # Coordinates are joined once per dataset; only the filters run on each rerun
+    df_with_coords = get_app_data_with_coords()
+    filtered_df_with_coords = None
+    if df_with_coords is not None:
+        filtered_df_with_coords = filter_data(df_with_coords, None, filters['heavy_metals'], 
+                                              filters['land_uses'], filters['year_range'])
+    
+    # Show map page content with built-in filters
+    show_map_page(filtered_df_with_coords, filters)
+    
+    # Display footer
+    display_footer(year_min, year_max, len(municipalities))
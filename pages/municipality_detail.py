@@ -2,17 +2,22 @@
 Municipality Detail Page - Deep dive into one or more municipalities
 """
 import streamlit as st
-import pandas as pd
-from utils.data_utils import calculate_national_averages
+from utils.data_utils import get_app_data, filter_data, get_precomputed_aggregates
 from utils.chart_utils import (
-    create_municipality_time_series_chart,
     create_national_comparison_chart,
     create_land_use_profile_chart
 )
-from utils.filter_utils import display_page_header, display_section_header, check_data_availability
+from utils.filter_utils import (
+    display_sidebar_filters,
+    display_data_summary,
+    display_footer,
+    display_page_header,
+    display_section_header,
+    check_data_availability
+)
 
 
-def show_municipality_detail_page(filtered_df, filters, full_df):
+def show_municipality_detail_page(filtered_df, filters):
     """Display the municipality detail page"""
     selected_municipalities = filters['municipalities']
     display_page_header(
@@ -43,8 +48,8 @@ def show_municipality_detail_page(filtered_df, filters, full_df):
         )
         
         # Calculate municipality averages by year
-        muni_yearly = muni_data.groupby(['Year', 'Heavy metal'])['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
-        national_yearly = calculate_national_averages(full_df)  # Use full dataset for national average
+        muni_yearly = muni_data.groupby(['Year', 'Heavy metal'], observed=True)['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
+        national_yearly = get_precomputed_aggregates()['nat_avg']  # Use full dataset for national average
         
         fig = create_national_comparison_chart(muni_yearly, national_yearly, selected_heavy_metals)
         st.plotly_chart(fig, width="stretch")
@@ -57,7 +62,7 @@ def show_municipality_detail_page(filtered_df, filters, full_df):
             "Which land uses in this municipality accumulate more heavy metals?"
         )
         
-        landuse_profile = muni_data.groupby(['Land use', 'Heavy metal'])['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
+        landuse_profile = muni_data.groupby(['Land use', 'Heavy metal'], observed=True)['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
         
         if not landuse_profile.empty:
             fig = create_land_use_profile_chart(landuse_profile, selected_municipalities)
@@ -66,10 +71,37 @@ def show_municipality_detail_page(filtered_df, filters, full_df):
     if not landuse_profile.empty:  
         # Summary statistics table
         st.subheader("📊 Summary Statistics")
-        summary_stats = muni_data.groupby(['Heavy metal', 'Land use'])['Heavy metal concentration (mg/kg DM)'].agg([
-            'count', 'mean', 'median', 'min', 'max', 'std'
-        ]).round(2)
+        # The median needs a sort per group, so it is only computed on request
+        include_median = st.checkbox("Include median", value=False)
+        statistics = {'count': 'count', 'mean': 'mean'}
+        if include_median:
+            statistics['median'] = 'median'
+        statistics.update({'min': 'min', 'max': 'max', 'std': 'std'})
+        
+        summary_stats = muni_data.groupby(['Heavy metal', 'Land use'], observed=True)['Heavy metal concentration (mg/kg DM)'].agg(
+            **statistics
+        ).round(2)
         
         st.dataframe(summary_stats, width="stretch")
     else:
-        st.warning("No land use data available for the selected municipalities and filters.")
\ No newline at end of file
+        st.warning("No land use data available for the selected municipalities and filters.")
+
+
+if __name__ == "__main__":
+    df, municipalities, heavy_metals, land_uses, year_min, year_max = get_app_data()
+    
+    # Create filters specific to municipality page
+    filters = display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, year_max, "municipality")
+    
+    # Filter data
+    filtered_df = filter_data(df, filters['municipalities'], filters['heavy_metals'], 
+                             filters['land_uses'], filters['year_range'])
+    
+    # Display data summary
+    display_data_summary(filtered_df)
+    
+    # Show municipality detail page content
+    show_municipality_detail_page(filtered_df, filters)
+    
+    # Display footer
+    display_footer(year_min, year_max, len(municipalities))
@@ -2,14 +2,38 @@
 Overview Dashboard Page - High-level exploration of heavy metals across Switzerland
 """
 import streamlit as st
-import pandas as pd
-from utils.data_utils import calculate_municipality_averages, calculate_national_averages
+from utils.data_utils import get_app_data, filter_data
 from utils.chart_utils import (
     create_top_municipalities_chart, 
     create_metal_time_series_chart, 
     create_land_use_breakdown_chart
 )
-from utils.filter_utils import display_page_header, display_section_header, check_data_availability, link_with_filters
+from utils.filter_utils import (
+    display_sidebar_filters,
+    display_data_summary,
+    display_footer,
+    display_page_header,
+    display_section_header,
+    check_data_availability,
+    link_with_filters
+)
+
+
+@st.cache_data
+def calculate_overview_data(filtered_df):
+    """
+    Compute the municipality averages, yearly averages, land use averages and
+    national averages shown on the overview
+    """
+    concentration = 'Heavy metal concentration (mg/kg DM)'
+    muni_averages = filtered_df.groupby(['Municipality', 'Heavy metal'], observed=True)[concentration].agg([
+        'mean', 'min', 'max', 'count'
+    ]).reset_index()
+    yearly_data = filtered_df.groupby(['Year', 'Heavy metal', 'Municipality'], observed=True)[concentration].mean().reset_index()
+    landuse_data = filtered_df.groupby(['Heavy metal', 'Land use'], observed=True)[concentration].mean().reset_index()
+    national_avg = filtered_df.groupby(['Heavy metal', 'Year'], observed=True)[concentration].mean().reset_index()
+    
+    return muni_averages, yearly_data, landuse_data, national_avg
 
 
 def show_overview_page(filtered_df, filters):
@@ -23,6 +47,16 @@ def show_overview_page(filtered_df, filters):
         return
     
     selected_heavy_metals = filters['heavy_metals']
+    muni_averages, yearly_data, landuse_data, national_avg = calculate_overview_data(filtered_df)
+    
+    # Split the tables by metal once, instead of masking them again for every metal
+    muni_averages_by_metal = dict(list(muni_averages.groupby('Heavy metal', observed=True)))
+    yearly_by_metal = dict(list(yearly_data.groupby('Heavy metal', observed=True)))
+    national_by_metal = dict(list(national_avg.groupby('Heavy metal', observed=True)))
+    top_by_metal = {
+        metal: muni_averages_by_metal.get(metal, muni_averages.iloc[:0]).nlargest(5, 'mean')
+        for metal in selected_heavy_metals
+    }
     
     # 1. Top 5 Municipalities Grid
     display_section_header(
@@ -30,18 +64,15 @@ def show_overview_page(filtered_df, filters):
         "Which municipalities have the highest concentrations of each heavy metal?"
     )
     
-    # Calculate averages for top municipalities
-    muni_averages = calculate_municipality_averages(filtered_df)
-    
     # Create small multiple charts for each heavy metal
     cols = st.columns(min(len(selected_heavy_metals), 3))
     for i, metal in enumerate(selected_heavy_metals):
         with cols[i % 3]:
-            metal_data = muni_averages[muni_averages['Heavy metal'] == metal].nlargest(5, 'mean')
+            metal_data = top_by_metal[metal]
             
             if not metal_data.empty:
                 fig = create_top_municipalities_chart(metal_data, metal)
-                if fig:
+                if fig is not None:
                     st.plotly_chart(fig, width="stretch")
                     
                     # Add links to municipality detail page for each top municipality
@@ -63,20 +94,18 @@ def show_overview_page(filtered_df, filters):
         "How do concentrations evolve over time, and how do specific municipalities compare to the average?"
     )
     
-    # Calculate yearly averages
-    yearly_data = filtered_df.groupby(['Year', 'Heavy metal', 'Municipality'])['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
-    national_avg = calculate_national_averages(filtered_df)
-    
     # Create time series plots - one for each heavy metal in a grid
     nb_cols = 2
     cols = st.columns(min(len(selected_heavy_metals), nb_cols))
     for i, metal in enumerate(selected_heavy_metals):
         with cols[i % nb_cols]:
-            metal_yearly_data = yearly_data[yearly_data['Heavy metal'] == metal]
-            metal_national_avg = national_avg[national_avg['Heavy metal'] == metal]
+            metal_yearly_data = yearly_by_metal.get(metal, yearly_data.iloc[:0])
+            metal_national_avg = national_by_metal.get(metal, national_avg.iloc[:0])
+            
+            top_municipalities = top_by_metal[metal]['Municipality'].tolist()
             
-            fig = create_metal_time_series_chart(metal_yearly_data, metal_national_avg, metal)
-            if fig:
+            fig = create_metal_time_series_chart(metal_yearly_data, metal_national_avg, metal, top_municipalities)
+            if fig is not None:
                 st.plotly_chart(fig, width="stretch")
     
     st.markdown("---")
@@ -87,8 +116,25 @@ def show_overview_page(filtered_df, filters):
         "How does land use affect heavy metal concentrations?"
     )
     
-    # Calculate averages by land use and heavy metal
-    landuse_data = filtered_df.groupby(['Heavy metal', 'Land use'])['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
-    
     fig = create_land_use_breakdown_chart(landuse_data)
-    st.plotly_chart(fig, width="stretch")
\ No newline at end of file
+    st.plotly_chart(fig, width="stretch")
+
+
+if __name__ == "__main__":
+    df, municipalities, heavy_metals, land_uses, year_min, year_max = get_app_data()
+    
+    # Create filters specific to overview page
+    filters = display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, year_max, "overview")
+    
+    # Filter data
+    filtered_df = filter_data(df, filters['municipalities'], filters['heavy_metals'], 
+                             filters['land_uses'], filters['year_range'])
+    
+    # Display data summary
+    display_data_summary(filtered_df)
+    
+    # Show overview page content
+    show_overview_page(filtered_df, filters)
+    
+    # Display footer
+    display_footer(year_min, year_max, len(municipalities))
@@ -3,7 +3,15 @@ Chart creation utilities for the Heavy Metals Dashboard
 """
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+
+# WebGL only draws faster than SVG for large point counts, and every WebGL chart
+# holds browser WebGL contexts, of which only a handful can be live at once
+WEBGL_MIN_POINTS = 1000
+
+
+def _scatter_trace_type(n_points):
+    """Scatter trace class for a chart plotting n_points: SVG, or WebGL for large point counts"""
+    return go.Scattergl if n_points >= WEBGL_MIN_POINTS else go.Scatter
 
 
 def create_top_municipalities_chart(metal_data, metal_name):
@@ -11,38 +19,40 @@ def create_top_municipalities_chart(metal_data, metal_name):
     if metal_data.empty:
         return None
         
-    fig = px.bar(
-        metal_data, 
-        x='Municipality', 
-        y='mean',
-        orientation='v',
-        title=f"{metal_name.title()}",
-        labels={'mean': 'Avg Concentration (mg/kg DM)', 'Municipality': ''},
-        color='mean',
-        color_continuous_scale='Reds'
-    )
-    fig.update_layout(height=300, showlegend=False)
-    fig.update_traces(
-        hovertemplate="<b>%{x}</b><br>" +
-                    "Avg: %{y:.1f} mg/kg DM<br>" +
-                    "<extra></extra>"
+    fig = go.Figure(
+        go.Bar(
+            x=metal_data['Municipality'],
+            y=metal_data['mean'].to_numpy(),
+            marker=dict(color=metal_data['mean'].to_numpy(), coloraxis='coloraxis'),
+            hovertemplate="<b>%{x}</b><br>" +
+                        "Avg: %{y:.1f} mg/kg DM<br>" +
+                        "<extra></extra>"
+        ),
+        layout=dict(
+            title=f"{metal_name.title()}",
+            xaxis_title='',
+            yaxis_title='Avg Concentration (mg/kg DM)',
+            coloraxis=dict(colorscale=px.colors.sequential.Reds, colorbar_title_text='Avg Concentration (mg/kg DM)'),
+            height=300,
+            showlegend=False
+        )
     )
     return fig
 
 
-def create_metal_time_series_chart(yearly_data, national_avg, metal):
-    """Create time series comparison chart"""
+def create_metal_time_series_chart(yearly_data, national_avg, metal, top_municipalities):
+    """Create time series comparison chart for the given top municipalities"""
     fig = go.Figure()
-    colors = px.colors.qualitative.Set1
     
     # Add municipality lines
-    metal_data = yearly_data[yearly_data['Heavy metal'] == metal]
+    metal_data = yearly_data[(yearly_data['Heavy metal'] == metal) & yearly_data['Municipality'].isin(top_municipalities)]
+    nat_data = national_avg[national_avg['Heavy metal'] == metal]
+    scatter = _scatter_trace_type(len(metal_data) + len(nat_data))
     
-    for municipality in metal_data['Municipality'].unique()[:5]:  # Top 5 municipalities
-        muni_data = metal_data[metal_data['Municipality'] == municipality]
-        fig.add_trace(go.Scatter(
-            x=muni_data['Year'],
-            y=muni_data['Heavy metal concentration (mg/kg DM)'],
+    for municipality, muni_data in metal_data.groupby('Municipality', observed=True, sort=False):
+        fig.add_trace(scatter(
+            x=muni_data['Year'].to_numpy(),
+            y=muni_data['Heavy metal concentration (mg/kg DM)'].to_numpy(),
             mode='lines+markers',
             name=f"{municipality}",
             line=dict(width=2),
@@ -53,11 +63,10 @@ def create_metal_time_series_chart(yearly_data, national_avg, metal):
         ))
     
     # Add national average line
-    nat_data = national_avg[national_avg['Heavy metal'] == metal]
     if not nat_data.empty:
-        fig.add_trace(go.Scatter(
-            x=nat_data['Year'],
-            y=nat_data['Heavy metal concentration (mg/kg DM)'],
+        fig.add_trace(scatter(
+            x=nat_data['Year'].to_numpy(),
+            y=nat_data['Heavy metal concentration (mg/kg DM)'].to_numpy(),
             mode='lines',
             name=f"National Avg",
             line=dict(dash='dash', width=3, color='gray'),
@@ -81,27 +90,27 @@ def create_metal_time_series_chart(yearly_data, national_avg, metal):
 
 def create_land_use_breakdown_chart(landuse_data):
     """Create stacked bar chart for land use breakdown"""
-    fig = px.bar(
-        landuse_data,
-        x='Heavy metal',
-        y='Heavy metal concentration (mg/kg DM)',
-        color='Land use',
-        title="Average Heavy Metal Concentrations by Land Use",
-        labels={'Heavy metal concentration (mg/kg DM)': 'Mean Concentration (mg/kg DM)'},
-        barmode='group'
-    )
-    
-    fig.update_layout(
-        height=500,
-        xaxis_title="Heavy Metal",
-        yaxis_title="Mean Concentration (mg/kg DM)"
-    )
-    
-    fig.update_traces(
-        hovertemplate="<b>%{fullData.name}</b><br>" +
-                    "Heavy Metal: %{x}<br>" +
-                    "Mean Concentration: %{y:.1f} mg/kg DM<br>" +
-                    "<extra></extra>"
+    fig = go.Figure(
+        [
+            go.Bar(
+                x=group['Heavy metal'],
+                y=group['Heavy metal concentration (mg/kg DM)'].to_numpy(),
+                name=land_use,
+                hovertemplate="<b>%{fullData.name}</b><br>" +
+                            "Heavy Metal: %{x}<br>" +
+                            "Mean Concentration: %{y:.1f} mg/kg DM<br>" +
+                            "<extra></extra>"
+            )
+            for land_use, group in landuse_data.groupby('Land use', observed=True, sort=False)
+        ],
+        layout=dict(
+            title="Average Heavy Metal Concentrations by Land Use",
+            barmode='group',
+            legend_title_text='Land use',
+            height=500,
+            xaxis_title="Heavy Metal",
+            yaxis_title="Mean Concentration (mg/kg DM)"
+        )
     )
     
     return fig
@@ -112,12 +121,17 @@ def create_municipality_time_series_chart(muni_data, selected_heavy_metals, muni
     fig = go.Figure()
     colors = px.colors.qualitative.Set1
     
+    # One sort up front leaves every per-metal slice already in year order
+    muni_data = muni_data.sort_values(['Heavy metal', 'Year'])
+    by_metal = dict(list(muni_data.groupby('Heavy metal', observed=True, sort=False)))
+    scatter = _scatter_trace_type(len(muni_data))
+    
     for i, metal in enumerate(selected_heavy_metals):
-        metal_data = muni_data[muni_data['Heavy metal'] == metal].sort_values('Year')
+        metal_data = by_metal.get(metal, muni_data.iloc[:0])
         
-        fig.add_trace(go.Scatter(
-            x=metal_data['Year'],
-            y=metal_data['Heavy metal concentration (mg/kg DM)'],
+        fig.add_trace(scatter(
+            x=metal_data['Year'].to_numpy(),
+            y=metal_data['Heavy metal concentration (mg/kg DM)'].to_numpy(),
             mode='markers+lines',
             name=metal.title(),
             line=dict(color=colors[i % len(colors)]),
@@ -143,14 +157,18 @@ def create_national_comparison_chart(muni_yearly, national_yearly, selected_heav
     fig = go.Figure()
     colors = px.colors.qualitative.Set1
     
+    muni_by_metal = dict(list(muni_yearly.groupby('Heavy metal', observed=True, sort=False)))
+    national_by_metal = dict(list(national_yearly.groupby('Heavy metal', observed=True, sort=False)))
+    scatter = _scatter_trace_type(len(muni_yearly) + len(national_yearly))
+    
     for i, metal in enumerate(selected_heavy_metals):
-        muni_metal = muni_yearly[muni_yearly['Heavy metal'] == metal]
-        national_metal = national_yearly[national_yearly['Heavy metal'] == metal]
+        muni_metal = muni_by_metal.get(metal, muni_yearly.iloc[:0])
+        national_metal = national_by_metal.get(metal, national_yearly.iloc[:0])
         
         # Municipality line
-        fig.add_trace(go.Scatter(
-            x=muni_metal['Year'],
-            y=muni_metal['Heavy metal concentration (mg/kg DM)'],
+        fig.add_trace(scatter(
+            x=muni_metal['Year'].to_numpy(),
+            y=muni_metal['Heavy metal concentration (mg/kg DM)'].to_numpy(),
             mode='lines+markers',
             name=f"{metal.title()} - Municipality",
             line=dict(color=colors[i % len(colors)], width=3),
@@ -158,9 +176,9 @@ def create_national_comparison_chart(muni_yearly, national_yearly, selected_heav
         ))
         
         # National average line
-        fig.add_trace(go.Scatter(
-            x=national_metal['Year'],
-            y=national_metal['Heavy metal concentration (mg/kg DM)'],
+        fig.add_trace(scatter(
+            x=national_metal['Year'].to_numpy(),
+            y=national_metal['Heavy metal concentration (mg/kg DM)'].to_numpy(),
             mode='lines',
             name=f"{metal.title()} - National Average",
             line=dict(color=colors[i % len(colors)], width=2, dash='dash'),
@@ -180,27 +198,27 @@ def create_national_comparison_chart(muni_yearly, national_yearly, selected_heav
 
 def create_land_use_profile_chart(landuse_profile, municipality_names):
     """Create land use profile chart for municipalities"""
-    fig = px.bar(
-        landuse_profile,
-        x='Land use',
-        y='Heavy metal concentration (mg/kg DM)',
-        color='Heavy metal',
-        title=f"Land Use Profile - {', '.join(municipality_names)}",
-        labels={'Heavy metal concentration (mg/kg DM)': 'Mean Concentration (mg/kg DM)'},
-        barmode='group'
-    )
-    
-    fig.update_layout(
-        height=500,
-        xaxis_title="Land Use",
-        yaxis_title="Mean Concentration (mg/kg DM)"
-    )
-    
-    fig.update_traces(
-        hovertemplate="<b>%{fullData.name}</b><br>" +
-                    "Land Use: %{x}<br>" +
-                    "Mean Concentration: %{y:.1f} mg/kg DM<br>" +
-                    "<extra></extra>"
+    fig = go.Figure(
+        [
+            go.Bar(
+                x=group['Land use'],
+                y=group['Heavy metal concentration (mg/kg DM)'].to_numpy(),
+                name=metal,
+                hovertemplate="<b>%{fullData.name}</b><br>" +
+                            "Land Use: %{x}<br>" +
+                            "Mean Concentration: %{y:.1f} mg/kg DM<br>" +
+                            "<extra></extra>"
+            )
+            for metal, group in landuse_profile.groupby('Heavy metal', observed=True, sort=False)
+        ],
+        layout=dict(
+            title=f"Land Use Profile - {', '.join(municipality_names)}",
+            barmode='group',
+            legend_title_text='Heavy metal',
+            height=500,
+            xaxis_title="Land Use",
+            yaxis_title="Mean Concentration (mg/kg DM)"
+        )
     )
     
     return fig
@@ -208,30 +226,27 @@ def create_land_use_profile_chart(landuse_profile, municipality_names):
 
 def create_municipality_ranking_chart(muni_ranking, metal_name):
     """Create horizontal bar chart for municipality ranking"""
-    fig = px.bar(
-        muni_ranking,
-        x='mean',
-        y='Municipality',
-        orientation='h',
-        title=f"Top 15 Municipalities - {metal_name.title()} Concentration",
-        labels={'mean': 'Average Concentration (mg/kg DM)', 'Municipality': ''},
-        color='mean',
-        color_continuous_scale='Reds',
-        hover_data=['count', 'min', 'max']
-    )
-    
-    fig.update_layout(
-        height=600,
-        yaxis={'categoryorder': 'total ascending'}
-    )
-    
-    fig.update_traces(
-        hovertemplate="<b>%{y}</b><br>" +
-                    "Avg Concentration: %{x:.1f} mg/kg DM<br>" +
-                    "Sample Count: %{customdata[0]}<br>" +
-                    "Min: %{customdata[1]:.1f} mg/kg DM<br>" +
-                    "Max: %{customdata[2]:.1f} mg/kg DM<br>" +
-                    "<extra></extra>"
+    fig = go.Figure(
+        go.Bar(
+            x=muni_ranking['mean'].to_numpy(),
+            y=muni_ranking['Municipality'],
+            orientation='h',
+            marker=dict(color=muni_ranking['mean'].to_numpy(), coloraxis='coloraxis'),
+            customdata=muni_ranking[['count', 'min', 'max']].to_numpy(),
+            hovertemplate="<b>%{y}</b><br>" +
+                        "Avg Concentration: %{x:.1f} mg/kg DM<br>" +
+                        "Sample Count: %{customdata[0]}<br>" +
+                        "Min: %{customdata[1]:.1f} mg/kg DM<br>" +
+                        "Max: %{customdata[2]:.1f} mg/kg DM<br>" +
+                        "<extra></extra>"
+        ),
+        layout=dict(
+            title=f"Top 15 Municipalities - {metal_name.title()} Concentration",
+            xaxis_title='Average Concentration (mg/kg DM)',
+            yaxis=dict(title_text='', categoryorder='total ascending'),
+            coloraxis=dict(colorscale=px.colors.sequential.Reds, colorbar_title_text='Average Concentration (mg/kg DM)'),
+            height=600
+        )
     )
     
     return fig
@@ -239,19 +254,30 @@ def create_municipality_ranking_chart(muni_ranking, metal_name):
 
 def create_time_evolution_chart(yearly_trends, overall_yearly, metal_name):
     """Create time evolution chart for heavy metal across municipalities"""
-    fig = px.line(
-        yearly_trends,
-        x='Year',
-        y='Heavy metal concentration (mg/kg DM)',
-        color='Municipality',
-        title=f"{metal_name.title()} Evolution Over Time (Top 8 Municipalities)",
-        markers=True
+    scatter = _scatter_trace_type(len(yearly_trends) + len(overall_yearly))
+    fig = go.Figure(
+        [
+            scatter(
+                x=group['Year'].to_numpy(),
+                y=group['Heavy metal concentration (mg/kg DM)'].to_numpy(),
+                mode='lines+markers',
+                name=municipality,
+                hovertemplate=f"Municipality={municipality}<br>" +
+                            "Year=%{x}<br>" +
+                            "Heavy metal concentration (mg/kg DM)=%{y}<extra></extra>"
+            )
+            for municipality, group in yearly_trends.groupby('Municipality', observed=True, sort=False)
+        ],
+        layout=dict(
+            title=f"{metal_name.title()} Evolution Over Time (Top 8 Municipalities)",
+            legend_title_text='Municipality'
+        )
     )
     
     # Add overall average line
-    fig.add_trace(go.Scatter(
-        x=overall_yearly['Year'],
-        y=overall_yearly['Heavy metal concentration (mg/kg DM)'],
+    fig.add_trace(scatter(
+        x=overall_yearly['Year'].to_numpy(),
+        y=overall_yearly['Heavy metal concentration (mg/kg DM)'].to_numpy(),
         mode='lines',
         name='Overall Average',
         line=dict(dash='dash', width=3, color='black'),
@@ -272,25 +298,25 @@ def create_time_evolution_chart(yearly_trends, overall_yearly, metal_name):
 
 def create_land_use_box_plot(metal_data, metal_name):
     """Create box plot for land use comparison"""
-    fig = px.box(
-        metal_data,
-        x='Land use',
-        y='Heavy metal concentration (mg/kg DM)',
-        title=f"{metal_name.title()} Distribution by Land Use",
-        color='Land use'
+    fig = go.Figure(
+        [
+            go.Box(
+                x=group['Land use'],
+                y=group['Heavy metal concentration (mg/kg DM)'].to_numpy(),
+                name=land_use,
+                hovertemplate="<b>%{x}</b><br>" +
+                            "Concentration: %{y:.1f} mg/kg DM<br>" +
+                            "<extra></extra>"
+            )
+            for land_use, group in metal_data.groupby('Land use', observed=True, sort=False)
+        ],
+        layout=dict(
+            title=f"{metal_name.title()} Distribution by Land Use",
+            height=500,
+            xaxis_title="Land Use",
+            yaxis_title="Concentration (mg/kg DM)",
+            showlegend=False
+        )
     )
     
-    fig.update_layout(
-        height=500,
-        xaxis_title="Land Use",
-        yaxis_title="Concentration (mg/kg DM)",
-        showlegend=False
-    )
-    
-    fig.update_traces(
-        hovertemplate="<b>%{x}</b><br>" +
-                    "Concentration: %{y:.1f} mg/kg DM<br>" +
-                    "<extra></extra>"
-    )
-    
-    return fig
\ No newline at end of file
+    return fig
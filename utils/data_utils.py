@@ -3,11 +3,27 @@ Data loading and processing utilities for the Heavy Metals Dashboard
 """
 import streamlit as st
 import pandas as pd
+import numpy as np
+from pathlib import Path
+
+
+def _file_version(path):
+    """Modification time and size of a file, or None if it does not exist"""
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
 
-@st.cache_data
 def load_data():
     """Load and preprocess the heavy metals data"""
+    return _load_data(_file_version('data.csv'))
+
+
+@st.cache_data(persist="disk", show_spinner=False, max_entries=4)
+def _load_data(file_version):
+    """Load data.csv; file_version only keys the disk cache, so edits to the file invalidate it"""
     df = pd.read_csv('data.csv')
     
     # Clean the data
@@ -21,17 +37,29 @@ def load_data():
     # Clean land use names
     df = df[df['Land use'] != 'Land use']  # Remove header row if it exists
     
+    # Low-cardinality labels as categoricals: masks and groupbys then compare integer codes
+    for col in ('Municipality', 'Heavy metal', 'Land use', 'Sampling Period'):
+        df[col] = df[col].astype('category')
+    
+    # Narrow numeric types halve the bytes every aggregation reads; float32 is
+    # ample for concentrations shown with two decimals
+    df['Heavy metal concentration (mg/kg DM)'] = df['Heavy metal concentration (mg/kg DM)'].astype('float32')
+    df['Year'] = df['Year'].astype('int16')
+    
     return df
 
 
 @st.cache_data
 def get_unique_values(df):
     """Get unique values for filters"""
-    municipalities = sorted(df['Municipality'].unique())
-    heavy_metals = sorted(df['Heavy metal'].unique())
-    land_uses = sorted(df['Land use'].unique())
-    year_min = int(df['Year'].min())
-    year_max = int(df['Year'].max())
+    # The categoricals built by load_data already hold their sorted unique labels
+    municipalities, heavy_metals, land_uses = (
+        df[col].cat.categories.tolist() if isinstance(df[col].dtype, pd.CategoricalDtype) else sorted(df[col].unique())
+        for col in ('Municipality', 'Heavy metal', 'Land use')
+    )
+    years = df['Year'].to_numpy()
+    year_min = int(years.min())
+    year_max = int(years.max())
 
     return dict(
         municipalities=municipalities, 
@@ -42,42 +70,104 @@ def get_unique_values(df):
     )
 
 
-def filter_data(df, municipalities, heavy_metals, land_uses, year_range):
-    """Filter data based on selected criteria"""
-    filtered_df = df.copy()
-    
-    if municipalities:
-        filtered_df = filtered_df[filtered_df['Municipality'].isin(municipalities)]
-    if heavy_metals:
-        filtered_df = filtered_df[filtered_df['Heavy metal'].isin(heavy_metals)]
-    if land_uses:
-        filtered_df = filtered_df[filtered_df['Land use'].isin(land_uses)]
+@st.cache_data
+def get_app_data():
+    """Load and cache app data shared by all pages"""
+    df = load_data()
     
-    filtered_df = filtered_df[
-        (filtered_df['Year'] >= year_range[0]) & 
-        (filtered_df['Year'] <= year_range[1])
-    ]
+    uniques = get_unique_values(df)
+    municipalities = uniques['municipalities']
+    heavy_metals = uniques['heavy_metals']
+    land_uses = uniques['land_uses']
+    year_min = uniques['year_min']
+    year_max = uniques['year_max']
+    return df, municipalities, heavy_metals, land_uses, year_min, year_max
+
+
+def load_geocoded_data():
+    """Load the geocoded municipalities, or None if the geocoding script has not been run"""
+    return _load_geocoded_data(_file_version('municipalities_geocoded.csv'))
+
+
+@st.cache_data(persist="disk", show_spinner=False, max_entries=4)
+def _load_geocoded_data(file_version):
+    """Read the geocoded municipalities; file_version only keys the disk cache"""
+    try:
+        # float32 still locates a municipality to about a metre
+        return pd.read_csv('municipalities_geocoded.csv', dtype={'Latitude': 'float32', 'Longitude': 'float32'})
+    except FileNotFoundError:
+        return None
+
+
+@st.cache_data
+def get_app_data_with_coords():
+    """
+    Join the app data with the municipality coordinates once per dataset,
+    so pages can filter the joined frame instead of merging on every rerun.
+    Returns None if the geocoded municipalities are not available.
+    """
+    geocoded = load_geocoded_data()
+    if geocoded is None:
+        return None
     
-    return filtered_df
+    df = get_app_data()[0]
+    df_with_coords = df.merge(geocoded, on='Municipality', how='inner')
+    # The join falls back to plain strings; restore the categorical filter_data relies on
+    df_with_coords['Municipality'] = df_with_coords['Municipality'].astype(df['Municipality'].dtype)
+    return df_with_coords
 
 
-def calculate_municipality_averages(df):
-    """Calculate average concentrations by municipality and heavy metal"""
-    return df.groupby(['Municipality', 'Heavy metal'])['Heavy metal concentration (mg/kg DM)'].agg([
-        'mean', 'min', 'max', 'count'
-    ]).reset_index()
+def _selects_everything(column, values):
+    """Check whether a filter selection covers every category of a column"""
+    return isinstance(column.dtype, pd.CategoricalDtype) and set(values) >= set(column.cat.categories)
 
 
+def filter_data(df, municipalities, heavy_metals, land_uses, year_range):
+    """Filter data based on selected criteria"""
+    # Build the row masks as plain arrays and combine them once; a selection
+    # covering the whole column (or a year range covering every year) cannot
+    # drop a row, so its mask is skipped
+    years = df['Year'].to_numpy()
+    masks = []
+    if len(years) and (year_range[0] > years.min() or year_range[1] < years.max()):
+        masks += [years >= year_range[0], years <= year_range[1]]
+    
+    for col, values in (('Municipality', municipalities), ('Heavy metal', heavy_metals), ('Land use', land_uses)):
+        if values and not _selects_everything(df[col], values):
+            masks.append(df[col].isin(values).to_numpy())
+    
+    # Nothing to filter out: hand back the frame itself rather than a copy
+    if not masks:
+        return df
+    return df[np.logical_and.reduce(masks)]
+
+
+@st.cache_data
 def calculate_national_averages(df):
     """Calculate national averages by heavy metal and year"""
-    return df.groupby(['Heavy metal', 'Year'])['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
+    return df.groupby(['Heavy metal', 'Year'], observed=True)['Heavy metal concentration (mg/kg DM)'].mean().reset_index()
+
+
+@st.cache_data
+def get_precomputed_aggregates():
+    """
+    National averages over the full dataset, computed once.
+    The municipality page compares against them instead of grouping the full data on every rerun.
+    """
+    df = get_app_data()[0]
+    return {
+        'nat_avg': calculate_national_averages(df)
+    }
 
 
 def get_data_summary(df):
     """Get summary statistics for the sidebar"""
+    # Reduce the raw year array directly; an empty selection still shows NaN bounds
+    years = df['Year'].to_numpy()
+    year_min, year_max = (years.min(), years.max()) if len(years) else (np.nan, np.nan)
     return {
         'total_records': len(df),
-        'municipalities': len(df['Municipality'].unique()),
-        'heavy_metals': len(df['Heavy metal'].unique()),
-        'year_range': f"{df['Year'].min():.0f} - {df['Year'].max():.0f}"
+        'municipalities': df['Municipality'].nunique(),
+        'heavy_metals': df['Heavy metal'].nunique(),
+        'year_range': f"{year_min:.0f} - {year_max:.0f}"
     }
\ No newline at end of file
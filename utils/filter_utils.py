@@ -16,47 +16,77 @@ Supported query parameters:
 - selected_heavy_metal_detail: single heavy metal name for detail page
 """
 import streamlit as st
-import json
-from urllib.parse import urlencode
+from urllib.parse import quote_plus, urlsplit, urlunsplit
+from utils.data_utils import get_data_summary
+
+
+def _parse_list(value):
+    """Parse a comma-separated list parameter"""
+    # Strip every item once, then drop the empty ones
+    return [item for item in (raw.strip() for raw in value.split(',')) if item]
+
+
+def _is_integer(text):
+    """Check whether a string holds a plain signed integer, surrounding whitespace allowed"""
+    text = text.strip()
+    digits = text[1:] if text[:1] in ('+', '-') else text
+    return digits.isdecimal()
+
+
+def _parse_range(value):
+    """Parse a "min,max" range parameter, or None if it is malformed"""
+    range_min, separator, range_max = value.partition(',')
+    # A third field leaves a comma in range_max, which fails the integer check
+    if separator and _is_integer(range_min) and _is_integer(range_max):
+        return (int(range_min), int(range_max))
+    return None
+
+
+def _serialize_range(value):
+    """Serialize a (min, max) range to the "min,max" parameter format"""
+    range_min, range_max = value
+    return f"{range_min},{range_max}"
+
+
+# Every filter stored in the query string, with the kind of value it holds
+_FILTER_SPEC = (
+    ('municipalities', 'list'),
+    ('heavy_metals', 'list'),
+    ('land_uses', 'list'),
+    ('year_range', 'range'),
+    ('selected_heavy_metal_detail', 'scalar'),
+)
+_PARSERS = {'list': _parse_list, 'range': _parse_range, 'scalar': str.strip}
+_SERIALIZERS = {'list': ','.join, 'range': _serialize_range, 'scalar': str}
+# Names of the filters link_with_filters accepts as overrides
+_FILTER_KEYS = frozenset(key for key, _ in _FILTER_SPEC)
+# Pages reachable by their own URL path; any other page links to the default overview
+_VALID_PAGES = frozenset(('municipality_detail_page', 'heavy_metal_detail_page'))
+# Filters dropped from the URL when unset; the year range is only ever overwritten
+_CLEARED_WHEN_UNSET = frozenset(key for key, kind in _FILTER_SPEC if kind != 'range')
 
 
 def get_filters_from_query_params():
     """Extract filter values from query parameters"""
-    query_params = st.query_params
-    filters = {}
-    
-    # Extract municipalities (stored as comma-separated string)
-    if 'municipalities' in query_params:
-        municipalities_str = query_params['municipalities']
-        if municipalities_str:  # Check if not empty
-            filters['municipalities'] = [m.strip() for m in municipalities_str.split(',') if m.strip()]
+    query_params = st.query_params.to_dict()
     
-    # Extract heavy metals (stored as comma-separated string)
-    if 'heavy_metals' in query_params:
-        heavy_metals_str = query_params['heavy_metals']
-        if heavy_metals_str:  # Check if not empty
-            filters['heavy_metals'] = [m.strip() for m in heavy_metals_str.split(',') if m.strip()]
+    # Reuse the last parse while the query string is unchanged, so repeated calls
+    # (e.g. from link_with_filters) only compare the parameters
+    signature = tuple(sorted(query_params.items()))
+    if st.session_state.get('_query_params_signature') == signature:
+        return dict(st.session_state['_query_params_filters'])
     
-    # Extract land uses (stored as comma-separated string)
-    if 'land_uses' in query_params:
-        land_uses_str = query_params['land_uses']
-        if land_uses_str:  # Check if not empty
-            filters['land_uses'] = [l.strip() for l in land_uses_str.split(',') if l.strip()]
-    
-    # Extract year range (stored as "min,max")
-    if 'year_range' in query_params:
-        year_range_str = query_params['year_range']
-        try:
-            year_min, year_max = year_range_str.split(',')
-            filters['year_range'] = (int(year_min.strip()), int(year_max.strip()))
-        except (ValueError, AttributeError):
-            pass
-    
-    # Extract selected heavy metal for detail page
-    if 'selected_heavy_metal_detail' in query_params:
-        filters['selected_heavy_metal_detail'] = query_params['selected_heavy_metal_detail'].strip()
+    filters = {}
+    for key, kind in _FILTER_SPEC:
+        value = query_params.get(key)
+        if value:  # Skip missing and empty parameters
+            parsed = _PARSERS[kind](value)
+            if parsed is not None:
+                filters[key] = parsed
     
-    return filters
+    st.session_state['_query_params_signature'] = signature
+    st.session_state['_query_params_filters'] = filters
+    return dict(filters)
 
 
 def link_with_filters(page, keep_current_filters=False, **override_filters):
@@ -71,17 +101,13 @@ def link_with_filters(page, keep_current_filters=False, **override_filters):
     Returns:
         str: URL with query parameters
     
+    Raises:
+        TypeError: If an override is not one of the known filters
+    
     Example:
         link_with_filters(page='municipality_detail_page', municipalities=['Zurich'])
         link_with_filters(page='heavy_metal_detail_page', keep_current_filters=True, selected_heavy_metal_detail='Cadmium')
     """
-    # Page mapping for the navigation
-    page_mapping = {
-        'overview': '',  # Default page
-        'municipality_detail_page': 'municipality_detail_page',
-        'heavy_metal_detail_page': 'heavy_metal_detail_page'
-    }
-    
     # Get base URL
     if hasattr(st, 'get_option') and st.get_option('server.baseUrlPath'):
         base_url = st.get_option('server.baseUrlPath')
@@ -93,53 +119,39 @@ def link_with_filters(page, keep_current_filters=False, **override_filters):
     if keep_current_filters:
         filters = get_filters_from_query_params()
     
-    # Apply override filters
+    # Apply override filters; a misspelled filter name would otherwise be dropped silently
+    unknown_filters = override_filters.keys() - _FILTER_KEYS
+    if unknown_filters:
+        raise TypeError(f"link_with_filters() got unknown filters: {', '.join(sorted(unknown_filters))}")
     filters.update(override_filters)
     
-    # Serialize filters to query parameters
-    params = serialize_filters_to_params(filters)
-    
     # Build query string
-    query_string = ''
-    if params:
-        query_string = '?' + urlencode(params)
+    query_string = '&'.join(_encode_filters(filters))
     
-    # Build full URL
-    page_path = page_mapping.get(page, '')
-    if page_path:
-        url = f"{base_url}/{page_path}{query_string}"
-    else:
-        url = f"{base_url}/{query_string}"
+    # Build full URL; the base path may be configured with or without its slashes,
+    # so normalize it to a single leading slash before appending the page
+    page_path = page if page in _VALID_PAGES else ''  # The overview is the default page
+    base_parts = urlsplit(base_url)
+    base_path = base_parts.path.strip('/')
+    path = f"/{base_path}/{page_path}" if base_path else f"/{page_path}"
     
-    return url
+    return urlunsplit((base_parts.scheme, base_parts.netloc, path, query_string, ''))
+
+
+def _encode_filters(filters):
+    """Yield the URL-encoded key=value pair of every set filter, in query string order"""
+    for key, kind in _FILTER_SPEC:
+        if filters.get(key):
+            yield f"{key}={quote_plus(_SERIALIZERS[kind](filters[key]))}"
 
 
 def serialize_filters_to_params(filters):
     """Convert filters dictionary to query parameter string format"""
-    params = {}
-    
-    # Serialize municipalities
-    if filters.get('municipalities'):
-        params['municipalities'] = ','.join(filters['municipalities'])
-    
-    # Serialize heavy metals
-    if filters.get('heavy_metals'):
-        params['heavy_metals'] = ','.join(filters['heavy_metals'])
-    
-    # Serialize land uses
-    if filters.get('land_uses'):
-        params['land_uses'] = ','.join(filters['land_uses'])
-    
-    # Serialize year range
-    if filters.get('year_range'):
-        year_min, year_max = filters['year_range']
-        params['year_range'] = f"{year_min},{year_max}"
-    
-    # Serialize selected heavy metal detail
-    if filters.get('selected_heavy_metal_detail'):
-        params['selected_heavy_metal_detail'] = filters['selected_heavy_metal_detail']
-    
-    return params
+    return {
+        key: _SERIALIZERS[kind](filters[key])
+        for key, kind in _FILTER_SPEC
+        if filters.get(key)
+    }
 
 
 def update_query_params(filters):
@@ -148,37 +160,14 @@ def update_query_params(filters):
         # Get serialized parameters
         params = serialize_filters_to_params(filters)
         
-        # Update municipalities
-        if 'municipalities' in params:
-            st.query_params['municipalities'] = params['municipalities']
-        else:
-            if 'municipalities' in st.query_params:
-                del st.query_params['municipalities']
-        
-        # Update heavy metals
-        if 'heavy_metals' in params:
-            st.query_params['heavy_metals'] = params['heavy_metals']
-        else:
-            if 'heavy_metals' in st.query_params:
-                del st.query_params['heavy_metals']
-        
-        # Update land uses
-        if 'land_uses' in params:
-            st.query_params['land_uses'] = params['land_uses']
-        else:
-            if 'land_uses' in st.query_params:
-                del st.query_params['land_uses']
-        
-        # Update year range
-        if 'year_range' in params:
-            st.query_params['year_range'] = params['year_range']
+        # Build the whole target query string first, keeping any other parameters as they are
+        current_params = st.query_params.to_dict()
+        target_params = {key: value for key, value in current_params.items() if key not in _CLEARED_WHEN_UNSET}
+        target_params.update(params)
         
-        # Update selected heavy metal detail
-        if 'selected_heavy_metal_detail' in params:
-            st.query_params['selected_heavy_metal_detail'] = params['selected_heavy_metal_detail']
-        else:
-            if 'selected_heavy_metal_detail' in st.query_params:
-                del st.query_params['selected_heavy_metal_detail']
+        # Write it in a single update, and not at all when the URL is already current
+        if target_params != current_params:
+            st.query_params.from_dict(target_params)
     except Exception as e:
         # If there's an error updating query params, continue without crashing
         st.sidebar.error(f"Error updating URL parameters: {str(e)}")
@@ -205,13 +194,18 @@ def display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, y
     # Page-specific filters
     additional_filters = {}
     
+    # Hash sets of the options, for checking the saved defaults against them
+    municipality_options = frozenset(municipalities)
+    heavy_metal_options = frozenset(heavy_metals)
+    land_use_options = frozenset(land_uses)
+    
     # Municipality Filter
     selected_municipalities = []
     if page_type == "municipality":
         # Get default from query params or use first municipality
         default_municipalities = saved_filters.get('municipalities', [municipalities[0]] if municipalities else [])
         # Ensure default municipalities exist in the available options
-        default_municipalities = [m for m in default_municipalities if m in municipalities]
+        default_municipalities = [m for m in default_municipalities if m in municipality_options]
         if not default_municipalities and municipalities:
             default_municipalities = [municipalities[0]]
             
@@ -226,7 +220,7 @@ def display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, y
         # Get default from query params
         default_municipalities = saved_filters.get('municipalities', [])
         # Ensure default municipalities exist in the available options
-        default_municipalities = [m for m in default_municipalities if m in municipalities]
+        default_municipalities = [m for m in default_municipalities if m in municipality_options]
         
         selected_municipalities = st.sidebar.multiselect(
             "Select Municipalities:",
@@ -243,13 +237,13 @@ def display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, y
         # Get default from query params or use first heavy metal
         default_heavy_metal = saved_filters.get('selected_heavy_metal_detail', heavy_metals[0] if heavy_metals else None)
         # Ensure default heavy metal exists in the available options
-        if default_heavy_metal not in heavy_metals and heavy_metals:
+        if default_heavy_metal not in heavy_metal_options and heavy_metals:
             default_heavy_metal = heavy_metals[0]
             
         selected_heavy_metal_detail = st.sidebar.selectbox(
             "Select Heavy Metal for Detail Analysis:",
             options=heavy_metals,
-            index=heavy_metals.index(default_heavy_metal) if default_heavy_metal in heavy_metals else 0,
+            index=heavy_metals.index(default_heavy_metal) if default_heavy_metal in heavy_metal_options else 0,
             help="Select one heavy metal for detailed analysis",
             key="heavy_metal_detail"
         )
@@ -259,7 +253,7 @@ def display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, y
         # Get default from query params or use first 3 heavy metals
         default_heavy_metals = saved_filters.get('heavy_metals', heavy_metals[:3] if len(heavy_metals) >= 3 else heavy_metals)
         # Ensure default heavy metals exist in the available options
-        default_heavy_metals = [m for m in default_heavy_metals if m in heavy_metals]
+        default_heavy_metals = [m for m in default_heavy_metals if m in heavy_metal_options]
         if not default_heavy_metals and heavy_metals:
             default_heavy_metals = heavy_metals[:3]
             
@@ -275,7 +269,7 @@ def display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, y
     # Get default from query params
     default_land_uses = saved_filters.get('land_uses', [])
     # Ensure default land uses exist in the available options
-    default_land_uses = [l for l in default_land_uses if l in land_uses]
+    default_land_uses = [l for l in default_land_uses if l in land_use_options]
         
     selected_land_uses = st.sidebar.multiselect(
         "Select Land Uses:",
@@ -313,7 +307,6 @@ def display_sidebar_filters(municipalities, heavy_metals, land_uses, year_min, y
     }
     
     # Update query parameters with current filter values
-    print('updating query params with', current_filters, selected_municipalities)  # --- IGNORE ---
     update_query_params(current_filters)
     
     return current_filters
@@ -323,10 +316,11 @@ def display_data_summary(filtered_df):
     """Display data summary in sidebar"""
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📊 Data Summary")
-    st.sidebar.metric("Total Records", len(filtered_df))
-    st.sidebar.metric("Municipalities", len(filtered_df['Municipality'].unique()))
-    st.sidebar.metric("Heavy Metals", len(filtered_df['Heavy metal'].unique()))
-    st.sidebar.metric("Years Covered", f"{filtered_df['Year'].min():.0f} - {filtered_df['Year'].max():.0f}")
+    summary = get_data_summary(filtered_df)
+    st.sidebar.metric("Total Records", summary['total_records'])
+    st.sidebar.metric("Municipalities", summary['municipalities'])
+    st.sidebar.metric("Heavy Metals", summary['heavy_metals'])
+    st.sidebar.metric("Years Covered", summary['year_range'])
 
 
 def check_data_availability(filtered_df, context=""):
@@ -337,22 +331,9 @@ def check_data_availability(filtered_df, context=""):
     return True
 
 
-def display_page_header(title, description):
-    """Display page header with title and description"""
-    st.markdown(f'<h2 class="page-header">{title}</h2>', unsafe_allow_html=True)
-    st.markdown(description)
-
-
-def display_section_header(title, question):
-    """Display section header with title and question"""
-    st.subheader(title)
-    st.markdown(f"*{question}*")
-
+_PAGE_HEADER_TEMPLATE = '<h2 class="page-header">{title}</h2>'
 
-def display_footer(year_min, year_max, num_municipalities):
-    """Display app footer with information"""
-    st.markdown("---")
-    st.markdown(f"""
+_FOOTER_TEMPLATE = """
 ### About This Dashboard
 
 This dashboard provides comprehensive analysis of heavy metal concentrations in Swiss soils. 
@@ -369,4 +350,22 @@ The data includes measurements from various municipalities across different land
 - Navigate between pages using the menu
 - Hover over charts for detailed information
 - Compare multiple municipalities and heavy metals simultaneously
-    """)
+    """
+
+
+def display_page_header(title, description):
+    """Display page header with title and description"""
+    st.markdown(_PAGE_HEADER_TEMPLATE.format(title=title), unsafe_allow_html=True)
+    st.markdown(description)
+
+
+def display_section_header(title, question):
+    """Display section header with title and question"""
+    st.subheader(title)
+    st.markdown(f"*{question}*")
+
+
+def display_footer(year_min, year_max, num_municipalities):
+    """Display app footer with information"""
+    st.markdown("---")
+    st.markdown(_FOOTER_TEMPLATE.format(year_min=year_min, year_max=year_max, num_municipalities=num_municipalities))